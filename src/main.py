@@ -1,11 +1,20 @@
 # Standard library imports
+import functools
+import hashlib
+import io
+import itertools
 import json
 import logging
 import os
 import re
 import shutil
+import statistics
 import sys
+import tarfile
+import threading
 import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
@@ -14,7 +23,21 @@ from pathlib import Path
 import requests
 from dotenv import load_dotenv
 
+# Optional third-party imports
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
 version = "R240807"
+archive_extensions = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+archive_extensions_pattern = r'\.(zip|tar|tar\.gz|tgz|tar\.bz2|tbz2|tar\.xz|txz)$'
 border = "=" * 79
 print(border)
 print(f"\n\tPaperOffice API Wrapper", version)
@@ -76,7 +99,7 @@ def setup_logging(log_file, env_config):
 
 # Function to clear relevant environment variables
 def clear_env_variables():
-    for var in ['API_KEY', 'LOG_LEVEL', 'LOG_FILE_MAX_MB', 'LOG_FILE_BACKUP_COUNT']:
+    for var in ['API_KEY', 'API_KEY_POOL', 'LOG_LEVEL', 'LOG_FILE_MAX_MB', 'LOG_FILE_BACKUP_COUNT']:
         if var in os.environ:
             del os.environ[var]
 
@@ -111,15 +134,38 @@ def load_env_file(root_path, env_file_name=".env"):
     # Retrieve environment variables and store them in a dictionary
     env_config = {
         "api_key": os.getenv('API_KEY', ''),  # Retrieve the API key, default to empty string if not found
+        "api_key_pool": os.getenv('API_KEY_POOL', ''),  # Retrieve the API key pool "key:weight:quota,...", default to empty string if not found
         "log_level": os.getenv('LOG_LEVEL', 'INFO').upper(),  # Retrieve the logging level, default to 'INFO' if not found
         "log_file_max_mb": os.getenv('LOG_FILE_MAX_MB') or 10,  # Retrieve the max log file size in MB, default to 10 MB if not found or empty
         "log_file_backup_count": os.getenv('LOG_FILE_BACKUP_COUNT') or 5  # Retrieve the log file backup count, default to 5 if not found or empty
     }
     
+    # Parse API_KEY_POOL entries "key", "key:weight" or "key:weight:quota"
+    env_config["api_keys"] = []
+    for entry in env_config["api_key_pool"].split(','):
+        if not entry.strip():
+            continue
+        
+        key, weight, quota = (entry.strip().split(':') + ['', ''])[:3]
+        try:
+            weight = float(weight) if weight else 1.0
+            quota = int(quota) if quota else None
+            if weight <= 0 or (quota is not None and quota <= 0):
+                raise ValueError
+        except ValueError:
+            logging.info(f'Invalid weight or quota for API key "{key[:4]}..." in API_KEY_POOL. Defaulting to weight 1 and no quota.')
+            weight, quota = 1.0, None
+        env_config["api_keys"].append({"key": key, "weight": weight, "quota": quota})
+    
+    # API_KEY is added to the pool as a key without quota
+    if env_config['api_key'] and env_config['api_key'] not in [api_key["key"] for api_key in env_config["api_keys"]]:
+        env_config["api_keys"].append({"key": env_config['api_key'], "weight": 1.0, "quota": None})
+    
     # Check if the API key is present in the environment variables
-    if not env_config['api_key']:
-        # Log an error and exit if the API key is missing
+    if not env_config["api_keys"]:
+        # Use the guest tier if no API key is given
         logging.info('API key missing in the ".env" file. Using guest tier.')
+        env_config["api_keys"].append({"key": "", "weight": 1.0, "quota": None})
 
     # Validate LOG_LEVEL and default to 'INFO' if invalid
     valid_log_levels = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
@@ -154,7 +200,7 @@ def load_env_file(root_path, env_file_name=".env"):
 # Check if json is well formatted
 def validate_json_keys(json_data) -> None:
     logging.debug(f'START - Validating json keys.')
-    required_folder_keys = {"folder_path", "output_folder", "endpoint"}
+    required_folder_keys = {"folder_path", "output_folder"}
     required_endpoint_keys = {"url", "payload"}
 
     if "folders" not in json_data:
@@ -167,19 +213,68 @@ def validate_json_keys(json_data) -> None:
             sys_exit()
 
         folder_keys = set(folder.keys())
-        if not required_folder_keys.issubset(folder_keys):
+        if not required_folder_keys.issubset(folder_keys) or not folder_keys & {"endpoint", "pipeline"}:
             logging.error(f'Invalid JSON format, invalid or missing key for folder.')
             sys_exit()
 
-        endpoint = folder.get("endpoint", {})
-        if not isinstance(endpoint, dict):
-            logging.error(f'Invalid JSON format, invalid "endpoint" key.')
+        if {"endpoint", "pipeline"}.issubset(folder_keys):
+            logging.error(f'Invalid JSON format, use either "endpoint" or "pipeline" for a folder, not both.')
             sys_exit()
 
-        endpoint_keys = set(endpoint.keys())
-        if not required_endpoint_keys.issubset(endpoint_keys):
-            logging.error(f'Invalid JSON format, invalid or missing key in "endpoint".')
+        # A pipeline is a list of endpoints, each stage processes the result of the previous stage
+        if "pipeline" in folder:
+            endpoints = folder["pipeline"]
+            if not isinstance(endpoints, list) or not endpoints:
+                logging.error(f'Invalid JSON format, "pipeline" must be a list of endpoints.')
+                sys_exit()
+        else:
+            endpoints = [folder["endpoint"]]
+
+        for endpoint in endpoints:
+            if not isinstance(endpoint, dict):
+                logging.error(f'Invalid JSON format, invalid "endpoint" key.')
+                sys_exit()
+
+            endpoint_keys = set(endpoint.keys())
+            if not required_endpoint_keys.issubset(endpoint_keys):
+                logging.error(f'Invalid JSON format, invalid or missing key in "endpoint".')
+                sys_exit()
+            
+        if not isinstance(folder.get("process_archives", False), bool):
+            logging.error(f'Invalid JSON format, "process_archives" must be true or false.')
             sys_exit()
+            
+        output_sink = folder.get("output_sink")
+        if output_sink is not None:
+            if not isinstance(output_sink, dict) or output_sink.get("format", "jsonl") not in ("jsonl", "parquet"):
+                logging.error(f'Invalid JSON format, "output_sink" must contain a "format" of "jsonl" or "parquet".')
+                sys_exit()
+            
+            for key in ("max_shard_mb", "fsync_every"):
+                value = output_sink.get(key, 1)
+                if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                    logging.error(f'Invalid JSON format, "{key}" in "output_sink" must be a positive integer.')
+                    sys_exit()
+            
+            if output_sink.get("format") == "parquet" and pq is None:
+                logging.error(f'The "parquet" output sink requires the "pyarrow" package. Please install it with "pip install pyarrow".')
+                sys_exit()
+                
+        split_config = folder.get("split")
+        if split_config is not None:
+            if not isinstance(split_config, dict):
+                logging.error(f'Invalid JSON format, invalid "split" key.')
+                sys_exit()
+            
+            for key in ("min_pages", "pages_per_chunk", "max_parallel"):
+                value = split_config.get(key, 1)
+                if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                    logging.error(f'Invalid JSON format, "{key}" in "split" must be a positive integer.')
+                    sys_exit()
+            
+            if PdfReader is None:
+                logging.error(f'The "split" option requires the "pypdf" package. Please install it with "pip install pypdf".')
+                sys_exit()
                         
     logging.debug(f'END - json keys validated.')
 
@@ -213,11 +308,300 @@ def read_api_file_processor_config_file(root_path):
 
 
 
+# Output_sink Class, appends text results to rolling JSONL or Parquet shards
+class Output_sink:
+    def __init__(self, output_folder, sink_config) -> None:
+        self.output_folder = Path(output_folder)
+        self.format = sink_config.get("format", "jsonl")
+        self.max_shard_bytes = sink_config.get("max_shard_mb", 256) * 1024 * 1024
+        self.fsync_every = sink_config.get("fsync_every", 100)
+        self.timestamp = datetime.now().strftime("%Y%m%d-%H%M%S%f")[:-3]
+        self.shard_index = 0
+        self.shard_file = None
+        self.shard_bytes = 0
+        self.handle = None
+        self.pending_records = []
+        self.unsynced_records = 0
+        self.durable_callbacks = []
+        logging.debug(f'Output_sink initialized: format "{self.format}", folder "{self.output_folder}".')
+    
+    
+    # Open the next shard file, Parquet shards are written under a temporary name until they are closed
+    def open_shard(self) -> None:
+        self.shard_index += 1
+        self.shard_bytes = 0
+        self.shard_file = self.output_folder / f'{self.timestamp}_results_{self.shard_index:05d}.{self.format}'
+        if self.format == "jsonl":
+            self.handle = open(self.shard_file, 'a', encoding='utf-8')
+        else:
+            schema = pa.schema([("source", pa.string()), ("sha256", pa.string()), ("job_id", pa.string()), ("text", pa.string())])
+            self.handle = pq.ParquetWriter(str(self.temp_shard_file()), schema)
+        logging.info(f'Output sink shard opened: {self.shard_file.name}')
+    
+    
+    def temp_shard_file(self) -> Path:
+        return self.shard_file.with_name(self.shard_file.name + ".tmp")
+    
+    
+    # Check if all written records are safely stored on disk
+    def is_durable(self) -> bool:
+        if self.format == "jsonl":
+            return self.unsynced_records == 0
+        return self.handle is None and not self.pending_records
+    
+    
+    # Run a callback once all records written so far are safely stored on disk, e.g. to move the source file
+    def add_durable_callback(self, callback) -> None:
+        if self.is_durable():
+            callback()
+        else:
+            self.durable_callbacks.append(callback)
+    
+    
+    def run_durable_callbacks(self) -> None:
+        durable_callbacks, self.durable_callbacks = self.durable_callbacks, []
+        for callback in durable_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f'Failed to finish a result stored in the output sink. Message: {str(e)}')
+    
+    
+    # Flush buffered records, JSONL shards are fsynced, Parquet records are written as one row group
+    def sync(self) -> None:
+        if self.handle is None:
+            return
+        if self.format == "jsonl":
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.unsynced_records = 0
+            self.run_durable_callbacks()
+        elif self.pending_records:
+            self.handle.write_table(pa.Table.from_pylist(self.pending_records, schema=self.handle.schema))
+            self.pending_records = []
+            self.unsynced_records = 0
+    
+    
+    # Close the current shard, a Parquet shard is only readable and durable once its footer is written
+    def close_shard(self) -> None:
+        if self.handle is None:
+            return
+        self.sync()
+        self.handle.close()
+        self.handle = None
+        if self.format == "parquet":
+            temp_file = self.temp_shard_file()
+            # Opened for writing, Windows refuses to fsync a read-only handle
+            with open(temp_file, 'r+b') as f:
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.shard_file)
+            self.run_durable_callbacks()
+        logging.info(f'Output sink shard closed: {self.shard_file.name}')
+    
+    
+    # Append a record, rotating the shard once it reaches the size limit
+    def write(self, record) -> None:
+        if self.handle is None:
+            self.open_shard()
+        
+        if self.format == "jsonl":
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            self.handle.write(line)
+            # Flush to the OS on every record, fsync only in batches
+            self.handle.flush()
+            self.shard_bytes += len(line.encode('utf-8'))
+        else:
+            self.pending_records.append(record)
+            self.shard_bytes += len(record["text"].encode('utf-8'))
+        
+        self.unsynced_records += 1
+        if self.unsynced_records >= self.fsync_every:
+            self.sync()
+        
+        if self.shard_bytes >= self.max_shard_bytes:
+            self.close_shard()
+    
+    
+    def close(self) -> None:
+        self.close_shard()
+
+
+# Hashing_reader Class, calculates the SHA-256 hash of a binary file object while it is read
+class Hashing_reader:
+    def __init__(self, file) -> None:
+        self.file = file
+        self.sha256 = hashlib.sha256()
+    
+    
+    def read(self, size=-1) -> bytes:
+        data = self.file.read(size)
+        self.sha256.update(data)
+        return data
+    
+    
+    def seekable(self) -> bool:
+        return self.file.seekable()
+    
+    
+    # Rewinding restarts the hash, e.g. when a job is retried with another API key
+    def seek(self, offset, whence=io.SEEK_SET) -> int:
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('Hashing_reader can only be rewound to the start.')
+        self.sha256 = hashlib.sha256()
+        return self.file.seek(0)
+    
+    
+    # Read what is left of the file, so the hash always covers the whole file
+    def hexdigest(self) -> str:
+        for _ in iter(lambda: self.read(1024 * 1024), b''):
+            pass
+        return self.sha256.hexdigest()
+
+
+# Job_history Class, records job durations to predict polling and timeouts for new jobs
+class Job_history:
+    def __init__(self, history_file, max_records_per_endpoint=200, min_records=3) -> None:
+        self.history_file = Path(history_file)
+        self.max_records_per_endpoint = max_records_per_endpoint
+        self.min_records = min_records
+        self.records = {}
+        self.lock = threading.Lock()
+        self.load()
+        logging.debug(f'Job_history initialized with {sum(len(r) for r in self.records.values())} record(s).')
+    
+    
+    # Load the history file, keeping only the most recent records per endpoint
+    def load(self) -> None:
+        if not self.history_file.exists():
+            return
+        
+        total_lines = 0
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    total_lines += 1
+                    try:
+                        record = json.loads(line)
+                        self.records.setdefault(record["endpoint"], []).append(record)
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except Exception as e:
+            logging.warning(f'Failed to read job history "{self.history_file}". Error: {str(e)}')
+            return
+        
+        for endpoint_url in self.records:
+            self.records[endpoint_url] = self.records[endpoint_url][-self.max_records_per_endpoint:]
+        
+        # Rewrite the file once it has grown well beyond the kept records
+        kept_records = [record for records in self.records.values() for record in records]
+        if total_lines > 2 * len(kept_records):
+            try:
+                with open(self.history_file, 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(record) + "\n" for record in kept_records)
+            except Exception as e:
+                logging.warning(f'Failed to trim job history "{self.history_file}". Error: {str(e)}')
+    
+    
+    # Add a finished job to the history
+    def add(self, record) -> None:
+        with self.lock:
+            records = self.records.setdefault(record["endpoint"], [])
+            records.append(record)
+            del records[:-self.max_records_per_endpoint]
+            try:
+                with open(self.history_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + "\n")
+            except Exception as e:
+                logging.warning(f'Failed to write job history "{self.history_file}". Error: {str(e)}')
+    
+    
+    # Predict upload, queue and processing seconds from the median rates of previous jobs
+    # Jobs without a known page count are left out, their per-page rate would be wrong
+    def predict(self, endpoint_url, size_bytes, pages):
+        with self.lock:
+            records = [record for record in self.records.get(endpoint_url, []) if record.get("pages")]
+        
+        if len(records) < self.min_records:
+            return None
+        
+        return {
+            "upload_seconds": statistics.median(r["upload_seconds"] / max(r["size_bytes"], 1) for r in records) * size_bytes,
+            "queue_seconds": statistics.median(r["queue_seconds"] for r in records),
+            "processing_seconds": statistics.median(r["processing_seconds"] / r["pages"] for r in records) * max(pages, 1)
+        }
+
+
+# API_key_pool Class, assigns jobs to the API keys in proportion to their weight
+class API_key_pool:
+    def __init__(self, api_keys, back_off_seconds=60) -> None:
+        self.api_keys = [dict(api_key, used=0, backed_off_until=0) for api_key in api_keys]
+        self.back_off_seconds = back_off_seconds
+        self.lock = threading.Lock()
+        logging.debug(f'API_key_pool initialized with {len(self.api_keys)} API key(s).')
+    
+    
+    def __len__(self) -> int:
+        return len(self.api_keys)
+    
+    
+    def __contains__(self, key) -> bool:
+        return any(api_key["key"] == key for api_key in self.api_keys)
+    
+    
+    # Jobs started relative to the weight, the key with the lowest load gets the next job
+    def load(self, api_key) -> float:
+        return api_key["used"] / api_key["weight"]
+    
+    
+    # Get the API key for a new job, returns None once all keys have reached their quota or are backed off
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            available_api_keys = [api_key for api_key in self.api_keys if (api_key["quota"] is None or api_key["used"] < api_key["quota"]) and api_key["backed_off_until"] <= now]
+            if not available_api_keys:
+                return None
+            
+            api_key = min(available_api_keys, key=self.load)
+            api_key["used"] += 1
+            return api_key["key"]
+    
+    
+    # Give back a job that could not be started with this API key, so it does not count against its quota and weight
+    def release(self, key) -> None:
+        with self.lock:
+            for api_key in self.api_keys:
+                if api_key["key"] == key and api_key["used"] > 0:
+                    api_key["used"] -= 1
+    
+    
+    # Skip a rate limited API key for new jobs until its back off time has passed
+    def back_off(self, key) -> None:
+        with self.lock:
+            for api_key in self.api_keys:
+                if api_key["key"] == key:
+                    api_key["backed_off_until"] = time.time() + self.back_off_seconds
+                    logging.warning(f'API key "{key[:4]}..." is rate limited and backed off for {self.back_off_seconds} seconds.')
+    
+    
+    def is_backed_off(self, key) -> bool:
+        with self.lock:
+            return any(api_key["key"] == key and api_key["backed_off_until"] > time.time() for api_key in self.api_keys)
+    
+    
+    # Drop an API key from the pool
+    def remove(self, key) -> None:
+        with self.lock:
+            if key in self:
+                self.api_keys = [api_key for api_key in self.api_keys if api_key["key"] != key]
+                logging.warning(f'API key "{key[:4]}..." dropped from the pool, {len(self.api_keys)} API key(s) left.')
+
+
 # API_file_processor Class
 class API_file_processor:
-    def __init__(self, api_file_processor_config, api_key) -> None:
+    def __init__(self, api_file_processor_config, api_key_pool, job_history=None) -> None:
         self.api_file_processor_config = api_file_processor_config
-        self.api_key = api_key
+        self.api_key_pool = api_key_pool
+        self.job_history = job_history
         self.total_folders = 0
         self.total_files = 0
         logging.debug('API_file_processor initialized with provided configuration.')
@@ -229,7 +613,11 @@ class API_file_processor:
             folder_configs = {
                 "folder_path": folder['folder_path'],
                 "output_folder": folder['output_folder'],
-                "endpoint": folder['endpoint']
+                "endpoint": folder.get('endpoint'),
+                "pipeline": folder.get('pipeline'),
+                "process_archives": folder.get('process_archives', False),
+                "output_sink": folder.get('output_sink'),
+                "split": folder.get('split')
             }
             self.process_folder(folder_configs)
         logging.debug('END - process_all_folders')
@@ -298,23 +686,33 @@ class API_file_processor:
 
 
     # Check response status code
-    def check_response_status_code(self, status_code, endpoint_url) -> bool:
+    def check_response_status_code(self, status_code, endpoint_url, api_key=None) -> bool:
         logging.debug(f'START - Checking status code.')
         if not status_code:
             return False
         elif status_code == 401:
             logging.error(f'Authentication failed. Status code: {status_code}. Please verify your API key and try again.')
-            sys_exit()
+            self.drop_api_key(api_key)
+            return False
         elif status_code == 429:
             logging.error(f'Request limit exceeded for endpoint: "{endpoint_url}". Status code: {status_code}. Please try again later or consider upgrading your plan.')
+            self.api_key_pool.back_off(api_key)
             return False        
         
         logging.debug(f'END - Status code checked.')
         return True
         
 
+    # Drop an invalid API key from the pool, exit once no API key is left
+    def drop_api_key(self, api_key) -> None:
+        self.api_key_pool.remove(api_key)
+        if not len(self.api_key_pool):
+            logging.error('No valid API key left.')
+            sys_exit()
+        
+
     # Check response status key result
-    def check_job_add_response_status_key(self, response_json, endpoint_url) -> bool:
+    def check_job_add_response_status_key(self, response_json, endpoint_url, api_key=None) -> bool:
         logging.debug(f'START - Checking response staus key.')
         """ 
         Responses: waiting4files, error
@@ -328,13 +726,16 @@ class API_file_processor:
                 response_code = response_json["code"]
                 if response_code == 429:
                     logging.error(f'Request limit exceeded for endpoint: "{endpoint_url}". Status code: 429. Please try again later or consider upgrading your plan.')
+                    self.api_key_pool.back_off(api_key)
                     return False
                 elif response_code == 401:
                     logging.error(f'Authentication failed. Status code: 401. Please verify your API key and try again.')
-                    sys_exit()
+                    self.drop_api_key(api_key)
+                    return False
                 elif response_code == 421:
                     logging.error(f'Tier limit can not be found. Status code: 421. Please verify your API key and try again.')
-                    sys_exit()   
+                    self.drop_api_key(api_key)
+                    return False
                 else: 
                     logging.error('Unknown error adding new job. Skipping file.')
                     return False
@@ -349,7 +750,7 @@ class API_file_processor:
             
 
     # 1. Send Request Job/add
-    def send_request_job_add(self, endpoint):
+    def send_request_job_add(self, endpoint, api_key):
         logging.debug(f'START - Send request') 
         endpoint_url = endpoint["url"]   
         
@@ -365,8 +766,8 @@ class API_file_processor:
         
         headers = {}
         
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
              
         try:
             response = requests.post(endpoint_url, data=payload, headers=headers, timeout=10)       
@@ -387,7 +788,7 @@ class API_file_processor:
             
   
     # Check response status key result
-    def check_job_upload_response_status_key(self, response_json) -> bool:
+    def check_job_upload_response_status_key(self, response_json, api_key=None) -> bool:
         logging.debug(f'START - Checking response staus key.')
         """ 
         Possible status responses: queued,  error
@@ -401,13 +802,16 @@ class API_file_processor:
                 response_code = response_json["code"]
                 if response_code == 429:
                     logging.error('Request limit exceeded for endpoint: "job/upload". Status code: 429. Please try again later or consider upgrading your plan.')
+                    self.api_key_pool.back_off(api_key)
                     return False
                 elif response_code == 401:
                     logging.error('Authentication failed. Status code: 401. Please verify your API key and try again.')
-                    sys_exit()
+                    self.drop_api_key(api_key)
+                    return False
                 elif response_code == 421:
                     logging.error('Tier limit can not be found. Status code: 421. Please verify your API key and try again.')
-                    sys_exit()  
+                    self.drop_api_key(api_key)
+                    return False
                 else: 
                     logging.error('Unknown error uploading file. Skipping file.')
                     return False 
@@ -422,20 +826,22 @@ class API_file_processor:
   
   
     # 2. Send Request Job/Upload
-    def send_request_job_upload(self, endpoint_url, file):
+    # "file" is either a file path or an already opened binary file object (e.g. an archive member)
+    def send_request_job_upload(self, endpoint_url, file, file_name, api_key, timeout=10):
         logging.debug('START - Send request upload')        
                 
         headers = {}
         
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
         
+        opened_file = isinstance(file, (str, os.PathLike))
         files = {
-            "job_files_0": open(file, 'rb')
+            "job_files_0": (file_name, open(file, 'rb') if opened_file else file)
         }
              
         try:
-            response = requests.post(endpoint_url, headers=headers, files=files, timeout=10)
+            response = requests.post(endpoint_url, headers=headers, files=files, timeout=(10, timeout))
             logging.info(f'File uploaded')
             logging.debug(f"Successfully uploaded file to: {response.url}")
             logging.debug(f'Response status code: {response.status_code}')
@@ -449,11 +855,12 @@ class API_file_processor:
         
         finally:
             logging.debug('END - Send request upload')
-            files["job_files_0"].close()
+            if opened_file:
+                files["job_files_0"][1].close()
         
 
     # Check response status key result
-    def check_job_status_response_status_key(self, response_json):
+    def check_job_status_response_status_key(self, response_json, api_key=None):
         logging.debug(f'START - Checking response staus key.')
         """ 
         Status options: 'queued', 'waiting4files', 'processing', 'completed', 'failed', 'timeout'
@@ -476,13 +883,16 @@ class API_file_processor:
                 response_code = response_json["code"]
                 if response_code == 429:
                     logging.error('Request limit exceeded for endpoint: "job/upload". Status code: 429. Please try again later or consider upgrading your plan.')
+                    self.api_key_pool.back_off(api_key)
                     return False
                 elif response_code == 401:
                     logging.error('Authentication failed. Status code: 401. Please verify your API key and try again.')
-                    sys_exit()
+                    self.drop_api_key(api_key)
+                    return False
                 elif response_code == 421:
                     logging.error('Tier limit can not be found. Status code: 421. Please verify your API key and try again.')
-                    sys_exit()  
+                    self.drop_api_key(api_key)
+                    return False
                 else: 
                     logging.error(f'Unknown error checking job status. Skipping file. Mesage: {response_json["message"]}')
                     return False
@@ -497,11 +907,16 @@ class API_file_processor:
 
 
     # 3. Send Request Job/status
-    def send_request_job_status(self, endpoint_url):
+    def send_request_job_status(self, endpoint_url, api_key):
         logging.debug('START - Send request Status') 
+        
+        headers = {}
+        
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
   
         try:
-            response = requests.get(endpoint_url, timeout=10)
+            response = requests.get(endpoint_url, headers=headers, timeout=10)
             logging.debug(f'Job status: {response.json()["status"]}')
             
             logging.debug(f"Checked job status: {response.url}")
@@ -518,9 +933,9 @@ class API_file_processor:
             logging.debug('END - Send request Status')
 
 
-    # 4. Download processed job files
-    def download_processed_job_files(self, downloadlink, output_folder, original_file_name) -> bool:
-        logging.debug('START - Downloading file') 
+    # Fetch processed job file content, returns (content, file_name) or (None, None)
+    def fetch_processed_job_file(self, downloadlink, original_file_name):
+        logging.debug('START - Fetching file') 
         
         try:
             response = requests.get(downloadlink, allow_redirects=True)
@@ -536,24 +951,104 @@ class API_file_processor:
                 else:
                     file_name = original_file_name
                 
-                timestamp = datetime.now().strftime("%Y%m%d-%H%M%S%f")[:-3]
-                file_name = f'{timestamp}_{file_name}'                
-                full_path_filename = Path(output_folder) / file_name
-                with open(full_path_filename, 'wb') as file:
-                    file.write(response.content)
-                logging.info(f'File downloaded successfully: {file_name}')
-                return True
+                return response.content, file_name
             else:
                 logging.error('Failed to download file.')
-                return False
+                return None, None
         
         except Exception as e:
             logging.error('Failed to download file.')
-            return False
+            return None, None
+        
+        finally:
+            logging.debug('END - Fetching file')
+
+
+    # 4. Download processed job files
+    # With keep_original_name, the original file name is kept and only the extension of the processed file is used
+    def download_processed_job_files(self, downloadlink, output_folder, original_file_name, keep_original_name=False) -> bool:
+        logging.debug('START - Downloading file') 
+        
+        try:
+            content, file_name = self.fetch_processed_job_file(downloadlink, original_file_name)
+            if content is None:
+                return False
+                
+            if keep_original_name:
+                file_name = Path(original_file_name).stem + (Path(file_name).suffix or Path(original_file_name).suffix)
+            
+            return self.save_processed_job_file(content, file_name, output_folder)
         
         finally:
             logging.debug('END - Downloading file')
 
+
+    # Save processed job file content to the output folder
+    def save_processed_job_file(self, content, file_name, output_folder) -> bool:
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S%f")[:-3]
+            file_name = f'{timestamp}_{file_name}'                
+            full_path_filename = Path(output_folder) / file_name
+            with open(full_path_filename, 'wb') as file:
+                file.write(content)
+            logging.info(f'File downloaded successfully: {file_name}')
+            return True
+        
+        except Exception as e:
+            logging.error(f'Failed to save downloaded file. Message: {str(e)}')
+            return False
+
+
+    # 4. Append the text of a processed job to the folder's output sink instead of writing a file per result
+    def write_processed_job_to_sink(self, downloadlink, output_sink, source, file_hash, job_id) -> bool:
+        logging.debug('START - Writing result to output sink') 
+        
+        try:
+            content, _ = self.fetch_processed_job_file(downloadlink, Path(source).name)
+            if content is None:
+                return False
+            
+            return self.write_result_to_sink(content, output_sink, source, file_hash, job_id)
+        
+        finally:
+            logging.debug('END - Writing result to output sink')
+    
+    
+    # Append processed job content as text record to the output sink
+    def write_result_to_sink(self, content, output_sink, source, file_hash, job_id) -> bool:
+        # Only text results fit the sink, e.g. a searchable PDF is rejected and the file is left in place
+        if content.startswith(b"%PDF"):
+            logging.error(f'Result of "{Path(source).name}" is a PDF, the output sink only accepts text results. Skipping file.')
+            return False
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            logging.error(f'Result of "{Path(source).name}" is not UTF-8 text, the output sink only accepts text results. Skipping file.')
+            return False
+        
+        try:
+            output_sink.write({
+                "source": source,
+                "sha256": file_hash,
+                "job_id": str(job_id),
+                "text": text
+            })
+            logging.info(f'Result written to output sink.')
+            return True
+        
+        except Exception as e:
+            logging.error(f'Failed to write result to output sink. Message: {str(e)}')
+            return False
+    
+    
+    # Calculate the SHA-256 hash of a file path
+    def calculate_file_hash(self, file) -> str:
+        sha256 = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
     
     # Move processed file to api_processed_files" folder
     def move_file_with_timestamp(self, file, file_name, processed_files_folder):
@@ -572,139 +1067,584 @@ class API_file_processor:
         return new_filename
 
 
-    # Process files
-    def process_files(self, folder_files_list, endpoint, processed_files_folder, output_folder) -> None:
-        logging.debug(f'START - process_files: {folder_files_list}') 
-        logging.debug(f'Endoint parameters: {endpoint}') 
-        for file in folder_files_list:
-            file_name = Path(file).name
-            logging.info(f'Processing file: "{file_name}"')
+    # Run a single job, a job is retried with another API key if its key has been dropped from the pool or is rate limited
+    def run_job(self, endpoint, file, file_name, file_size=None):
+        """ 
+        Returns: ("completed", job_id, downloadlink), ("skip_file", None, None) or ("skip_folder", None, None)
+        """
+        while True:
+            api_key = self.api_key_pool.acquire()
+            if api_key is None:
+                logging.error(f'No API key available, all keys have reached their quota or are rate limited. Skipping file: {file_name}.')
+                return "skip_folder", None, None
             
-            # 1. Add job
-            response_json, status_code = self.send_request_job_add(endpoint)
+            job_result, job_id, downloadlink = self.run_job_with_api_key(endpoint, file, file_name, api_key, file_size)
+            if job_result not in ("invalid_api_key", "rate_limited"):
+                return job_result, job_id, downloadlink
+            
+            self.api_key_pool.release(api_key)
+            logging.info(f'Retrying file "{file_name}" with another API key.')
+            if not isinstance(file, (str, os.PathLike)):
+                file.seek(0)
+
+
+    # Run a single job: add job, upload file and wait until the job has finished
+    # All requests of the job are pinned to the API key that created it
+    def run_job_with_api_key(self, endpoint, file, file_name, api_key, file_size=None):
+        """ 
+        Returns: ("completed", job_id, downloadlink), ("skip_file", None, None), ("skip_folder", None, None), ("invalid_api_key", None, None) or ("rate_limited", None, None)
+        """
+        # 1. Add job
+        response_json, status_code = self.send_request_job_add(endpoint, api_key)
+        
+        if not status_code:
+            return "skip_file", None, None
+        
+        if not self.check_response_status_code(status_code, endpoint["url"], api_key):
+            return self.failed_job_status(api_key, "skip_folder")
+
+        if not response_json:
+            logging.error(f'Request job/add failed for file: {file_name}. Skipping file.')
+            return "skip_file", None, None
+        
+        # check response status key
+        if self.check_job_add_response_status_key(response_json, endpoint["url"], api_key):
+            logging.info(f'Job waiting for files.')
+        else:
+            return self.failed_job_status(api_key, "skip_file")
+        
+        # Predict polling and timeouts from previous jobs of the same endpoint
+        size_bytes, pages = self.get_file_stats(file, file_name, file_size)
+        first_poll_delay, stuck_timeout, upload_timeout = self.get_job_timings(endpoint["url"], size_bytes, pages)
+        
+        # 2. Upload file
+        # Get assigned server and job ID
+        job_assigned_api_endpoint = response_json["job_assigned_api_endpoint"]
+        job_id = response_json["job_id"]            
+        endpoint_url = f'https://{job_assigned_api_endpoint}/V5/job/upload/{job_id}'
+        upload_start_time = time.time()
+        response_json, status_code = self.send_request_job_upload(endpoint_url, file, file_name, api_key, upload_timeout)
+        uploaded_time = time.time()
+        
+        if not status_code:
+            return "skip_file", None, None
+        
+        if not self.check_response_status_code(status_code, endpoint_url, api_key):
+            return self.failed_job_status(api_key, "skip_folder")
+        
+        if not response_json:
+            logging.error(f'Request job/upload failed for file: {file_name}. Skipping file.')
+            return "skip_file", None, None
+        
+        if self.check_job_upload_response_status_key(response_json, api_key):
+            logging.info(f'File queued')
+        else:
+            return self.failed_job_status(api_key, "skip_file")
+        
+        
+        # 3. Check job status
+        logging.info(f'Checking job status.')
+        endpoint_url = f'https://{job_assigned_api_endpoint}/V5/job/status/{job_id}'
+
+        logging.debug(f'First job status check in {first_poll_delay:.1f} seconds.')
+        time.sleep(first_poll_delay)
+        processing_start_time = None
+        for i in itertools.count():
+            
+            response_json, status_code = self.send_request_job_status(endpoint_url, api_key)
             
             if not status_code:
+                return "skip_file", None, None
+            
+            # The job is already uploaded, a rate limited status check is repeated for the same job with the same API key
+            if status_code == 429 or (response_json and response_json.get("status") == "error" and response_json.get("code") == 429):
+                if i >= 30 and (stuck_timeout is None or time.time() - uploaded_time > stuck_timeout):
+                    logging.error('File processing is taking too long, please try again.')
+                    return "skip_file", None, None
+                
+                self.api_key_pool.back_off(api_key)
+                wait_seconds = (response_json or {}).get("next_call_in_seconds") or self.api_key_pool.back_off_seconds
+                logging.warning(f'Job status check rate limited, checking again in {wait_seconds} seconds.')
+                time.sleep(wait_seconds)
                 continue
             
-            if not self.check_response_status_code(status_code, endpoint["url"]):
-                break
-
+            if not self.check_response_status_code(status_code, endpoint_url, api_key):
+                return self.failed_job_status(api_key, "skip_folder")
+        
             if not response_json:
-                logging.error(f'Request job/add failed for file: {file_name}. Skipping file.')
-                continue            
+                logging.error(f'Request job/status failed for file: {file_name}. Skipping file.')
+                return "skip_file", None, None
             
-            # check response status key
-            if self.check_job_add_response_status_key(response_json, endpoint["url"]):
-                logging.info(f'Job waiting for files.')
+            job_response_status = self.check_job_status_response_status_key(response_json, api_key)
+            if job_response_status == "queued": 
+                logging.info('File queued, waiting for free slot.')
+            elif job_response_status == "processing":
+                logging.info('File is being processed.')
+                if processing_start_time is None:
+                    processing_start_time = time.time()
+            elif job_response_status == "failed":
+                logging.error(f'File processing has failed please try again.')
+                return "skip_file", None, None
+            elif job_response_status == "completed":
+                logging.info('File processing completed.')
+                downloadlink = response_json["downloadlink"]
+                logging.info(f'File downloadlink: {downloadlink}')
+                
+                completed_time = time.time()
+                if self.job_history and size_bytes is not None:
+                    processing_start_time = processing_start_time or uploaded_time
+                    self.job_history.add({
+                        "endpoint": endpoint["url"],
+                        "size_bytes": size_bytes,
+                        "pages": pages,
+                        "upload_seconds": round(uploaded_time - upload_start_time, 3),
+                        "queue_seconds": round(processing_start_time - uploaded_time, 3),
+                        "processing_seconds": round(completed_time - processing_start_time, 3),
+                        "timestamp": datetime.now().isoformat(timespec='seconds')
+                    })
+                return "completed", job_id, downloadlink
             else:
-                continue
+                logging.error('File processing error, please try again.')
+                return self.failed_job_status(api_key, "skip_file")
             
-            # 2. Upload file
-            # Get assigned server and job ID
-            job_assigned_api_endpoint = response_json["job_assigned_api_endpoint"]
-            job_id = response_json["job_id"]            
-            endpoint_url = f'https://{job_assigned_api_endpoint}/V5/job/upload/{job_id}'
-            response_json, status_code = self.send_request_job_upload(endpoint_url, file)
+            # Never give up before 30 polls, with job history only once the predicted duration is clearly exceeded as well
+            if i >= 30 and (stuck_timeout is None or time.time() - uploaded_time > stuck_timeout):
+                logging.error('File processing is taking too long, please try again.')
+                return "skip_file", None, None
             
-            if not status_code:
-                continue
             
-            if not self.check_response_status_code(status_code, endpoint_url):
-                break
+            # Get next_call_in_seconds
+            next_call_in_seconds = response_json["next_call_in_seconds"]
+            logging.info(f'Check job status interval for API key is {next_call_in_seconds} seconds.')
+            for i in range(next_call_in_seconds, -1, -1):
+                print(f'Next job status check in: {i} seconds', end="\r")
+                sys.stdout.flush()
+                time.sleep(1)
+            time.sleep(0.3)
+
+
+    # Get the job result after a failed request, jobs whose API key was dropped or backed off can be retried with another key
+    def failed_job_status(self, api_key, job_result):
+        if api_key not in self.api_key_pool:
+            return "invalid_api_key", None, None
+        if self.api_key_pool.is_backed_off(api_key):
+            return "rate_limited", None, None
+        return job_result, None, None
+
+
+    # Run a file through all endpoints of a pipeline, the result of each stage is uploaded to the next stage from memory
+    def run_pipeline(self, endpoints, file, file_name, file_size=None):
+        """ 
+        Returns the run_job result of the last stage
+        """
+        stage_file, stage_file_name = file, file_name
+        for stage, endpoint in enumerate(endpoints, start=1):
+            if len(endpoints) > 1:
+                logging.info(f'Pipeline stage {stage}/{len(endpoints)} for file: "{file_name}"')
             
-            if not response_json:
-                logging.error(f'Request job/upload failed for file: {file_name}. Skipping file.')
-                continue 
+            job_result, job_id, downloadlink = self.run_job(endpoint, stage_file, stage_file_name, file_size)
+            if job_result != "completed" or stage == len(endpoints):
+                return job_result, job_id, downloadlink
             
-            if self.check_job_upload_response_status_key(response_json):
-                logging.info(f'File queued')
+            content, result_file_name = self.fetch_processed_job_file(downloadlink, stage_file_name)
+            if content is None:
+                logging.error(f'Failed to download the result of pipeline stage {stage} for file: {file_name}. Skipping file.')
+                return "skip_file", None, None
+            
+            stage_file, stage_file_name, file_size = io.BytesIO(content), result_file_name, len(content)
+
+
+    # Get the size in bytes and the page count of a file path or an opened binary file object
+    # Streamed files (e.g. archive members) are not read here, their size is taken from the archive index
+    # The page count is None if it cannot be determined reliably
+    def get_file_stats(self, file, file_name, file_size=None):
+        is_pdf = Path(file_name).suffix.lower() == ".pdf"
+        try:
+            if isinstance(file, (str, os.PathLike)):
+                size_bytes = os.path.getsize(file)
+            elif isinstance(file, io.BytesIO):
+                size_bytes = len(file.getbuffer())
             else:
-                continue
+                return file_size, None if is_pdf else 1
             
+            if not is_pdf:
+                return size_bytes, 1
+            if PdfReader is None:
+                return size_bytes, None
             
-            # 3. Check job status
-            logging.info(f'Checking job status.')
-            endpoint_url = f'https://{job_assigned_api_endpoint}/V5/job/status/{job_id}'
+            pages = len(PdfReader(file).pages)
+            if isinstance(file, io.BytesIO):
+                file.seek(0)
+            return size_bytes, pages
+        except Exception as e:
+            logging.debug(f'Failed to get file stats for "{file_name}". Message: {str(e)}')
+            if isinstance(file, io.BytesIO):
+                file.seek(0)
+            return file_size, None
+    
+    
+    # Get first poll delay, stuck timeout and upload timeout in seconds for a job
+    def get_job_timings(self, endpoint_url, size_bytes, pages):
+        size_mb = (size_bytes or 0) / (1024 * 1024)
+        prediction = self.job_history.predict(endpoint_url, size_bytes, pages) if self.job_history and size_bytes is not None and pages is not None else None
+        
+        if not prediction:
+            # Defaults until enough jobs for this endpoint have been recorded
+            return 3, None, 10 + size_mb
+        
+        predicted_seconds = prediction["queue_seconds"] + prediction["processing_seconds"]
+        
+        # Poll slightly before the predicted completion, so the history keeps correcting itself downwards
+        first_poll_delay = min(max(1, predicted_seconds * 0.8), 300)
+        stuck_timeout = max(60, predicted_seconds * 3)
+        upload_timeout = max(10, prediction["upload_seconds"] * 3)
+        logging.debug(f'Predicted job duration: {predicted_seconds:.1f} seconds, first poll in {first_poll_delay:.1f} seconds, stuck after {stuck_timeout:.1f} seconds.')
+        return first_poll_delay, stuck_timeout, upload_timeout
 
-            skip_folder = False
-            skip_file = False
-            downloadlink = None
-            time.sleep(3)
-            for i in range(100):
-                
-                response_json, status_code = self.send_request_job_status(endpoint_url)
-                
-                if not status_code:
-                    skip_file = True
-                    break
-                
-                if not self.check_response_status_code(status_code, endpoint_url):
-                    skip_folder = True
-                    break 
+
+    # Process files
+    def process_files(self, folder_files_list, endpoints, processed_files_folder, output_folder, output_sink=None, split_config=None) -> None:
+        logging.debug(f'START - process_files: {folder_files_list}') 
+        logging.debug(f'Endoint parameters: {endpoints}') 
+        
+        # With a pipeline, one file per stage is processed at the same time, so the stages of consecutive files overlap
+        executor = None
+        pipeline_futures = {}
+        if len(endpoints) > 1 and not split_config:
+            executor = ThreadPoolExecutor(max_workers=len(endpoints))
+        
+        try:
+            self.process_files_in_order(folder_files_list, endpoints, processed_files_folder, output_folder, output_sink, split_config, executor, pipeline_futures)
+        finally:
+            if executor:
+                # Pipelines that have not started yet are cancelled, the results of started pipelines are still saved
+                # so that their jobs are not charged again on the next run
+                for future in pipeline_futures.values():
+                    future.cancel()
+                for file, future in pipeline_futures.items():
+                    if future.cancelled():
+                        continue
+                    try:
+                        job_result, job_id, downloadlink = future.result()
+                        if job_result == "completed":
+                            self.save_job_result(file, Path(file).name, job_id, downloadlink, processed_files_folder, output_folder, output_sink)
+                    except Exception as e:
+                        logging.error(f'Failed to save the result of file "{Path(file).name}". Message: {str(e)}')
+                executor.shutdown()
+        
+        logging.debug('END - All files processed from folder.')
+    
+    
+    # Process files one after another, with a pipeline the next files are started ahead of the current file
+    def process_files_in_order(self, folder_files_list, endpoints, processed_files_folder, output_folder, output_sink, split_config, executor, pipeline_futures) -> None:
+        for index, file in enumerate(folder_files_list):
+            file_name = Path(file).name
+            logging.info(f'Processing file: "{file_name}"')
             
-                if not response_json:
-                    logging.error(f'Request job/status failed for file: {file_name}. Skipping file.')
-                    skip_file = True
-                    break
-                
-                job_response_status = self.check_job_status_response_status_key(response_json)
-                if job_response_status == "queued": 
-                    logging.info('File queued, waiting for free slot.')
-                elif job_response_status == "processing":
-                    logging.info('File is being processed.')
-                elif job_response_status == "failed":
-                    logging.error(f'File processing has failed please try again.')
-                    skip_file = True
-                    break
-                elif job_response_status == "completed":
-                    logging.info('File processing completed.')
-                    downloadlink = response_json["downloadlink"]
-                    logging.info(f'File downloadlink: {downloadlink}')
-                    break
-                else:
-                    logging.error('File processing error, please try again.')
-                    skip_file = True
+            # Keep at most one file per pipeline stage in flight, starting with the current file
+            if executor:
+                for next_file in folder_files_list[index:index + len(endpoints)]:
+                    if next_file not in pipeline_futures:
+                        pipeline_futures[next_file] = executor.submit(self.run_pipeline, endpoints, next_file, Path(next_file).name)
+            
+            # Large PDFs are split into page chunks, files that are not split are processed as a whole
+            if split_config:
+                split_result = self.process_split_file(file, file_name, endpoints, output_folder, output_sink, split_config)
+                if split_result == "skip_folder":
                     break
-                
-                if i >= 30:
-                    logging.error('File processing is taking too long, please try again.')
-                    skip_file = True
-                    break                    
-                
-                
-                # Get next_call_in_seconds
-                next_call_in_seconds = response_json["next_call_in_seconds"]
-                logging.info(f'Check job status interval for API key is {next_call_in_seconds} seconds.')
-                for i in range(next_call_in_seconds, -1, -1):
-                    print(f'Next job status check in: {i} seconds', end="\r")
-                    sys.stdout.flush()
-                    time.sleep(1)
-                time.sleep(0.3)
+                if split_result == "skip_file":
+                    continue
+                if split_result == "completed":
+                    self.run_when_durable(output_sink, functools.partial(self.move_file_with_timestamp, file, file_name, processed_files_folder))
+                    self.total_files += 1
+                    continue
+            
+            if file in pipeline_futures:
+                job_result, job_id, downloadlink = pipeline_futures.pop(file).result()
+            else:
+                job_result, job_id, downloadlink = self.run_pipeline(endpoints, file, file_name)
                               
-            if skip_folder:
+            if job_result == "skip_folder":
                 break
-            if skip_file:
+            if job_result == "skip_file":
                 continue                
             
-            # 4. Download file
-            logging.info(f'Downloading file')
-            move_processed_file = False
-            if downloadlink:                
-                if self.download_processed_job_files(downloadlink, output_folder, file_name):
-                    move_processed_file = True
+            self.save_job_result(file, file_name, job_id, downloadlink, processed_files_folder, output_folder, output_sink)
+    
+    
+    # Download the result of a completed job and move the processed file
+    def save_job_result(self, file, file_name, job_id, downloadlink, processed_files_folder, output_folder, output_sink) -> None:
+        # 4. Download file
+        logging.info(f'Downloading file')
+        move_processed_file = False
+        if downloadlink:                
+            if output_sink:
+                move_processed_file = self.write_processed_job_to_sink(downloadlink, output_sink, str(file), self.calculate_file_hash(file), job_id)
+            elif self.download_processed_job_files(downloadlink, output_folder, file_name):
+                move_processed_file = True
+        else:
+            logging.error('File download-link not available. skipping file.')
+            return
+        
+        
+        if move_processed_file:    
+            self.run_when_durable(output_sink, functools.partial(self.move_file_with_timestamp, file, file_name, processed_files_folder))
+        
+        # Add 1 to total processed files
+        self.total_files += 1
+    
+    
+    # Run a callback once all records written to the output sink are durable, or immediately without a sink
+    def run_when_durable(self, output_sink, callback) -> None:
+        if output_sink:
+            output_sink.add_durable_callback(callback)
+        else:
+            callback()
+            
+
+    # Split a large PDF into page chunks, process them as parallel jobs and merge the results in order
+    def process_split_file(self, file, file_name, endpoints, output_folder, output_sink, split_config):
+        """ 
+        Returns: "completed", "skip_file", "skip_folder" or None if the file is not split
+        """
+        if Path(file_name).suffix.lower() != ".pdf":
+            return None
+        
+        try:
+            reader = PdfReader(file)
+            page_count = len(reader.pages)
+        except Exception as e:
+            logging.warning(f'Failed to read PDF "{file_name}" for splitting. Message: {str(e)}. Processing file as a whole.')
+            return None
+        
+        if page_count < split_config.get("min_pages", 100):
+            return None
+        
+        logging.debug(f'START - Splitting file: {file_name}')
+        pages_per_chunk = split_config.get("pages_per_chunk", 50)
+        chunks = []
+        try:
+            for start in range(0, page_count, pages_per_chunk):
+                end = min(start + pages_per_chunk, page_count)
+                writer = PdfWriter()
+                for page_number in range(start, end):
+                    writer.add_page(reader.pages[page_number])
+                chunk = io.BytesIO()
+                writer.write(chunk)
+                chunk.seek(0)
+                chunks.append((f'{Path(file_name).stem}_pages_{start + 1}-{end}.pdf', chunk))
+        except Exception as e:
+            logging.warning(f'Failed to split PDF "{file_name}". Message: {str(e)}. Processing file as a whole.')
+            return None
+        logging.info(f'File "{file_name}" with {page_count} pages split into {len(chunks)} chunks.')
+        
+        with ThreadPoolExecutor(max_workers=split_config.get("max_parallel", 4)) as executor:
+            job_results = list(executor.map(lambda chunk: self.run_pipeline(endpoints, chunk[1], chunk[0]), chunks))
+        
+        job_statuses = [job_result for job_result, _, _ in job_results]
+        if "skip_folder" in job_statuses:
+            return "skip_folder"
+        if "skip_file" in job_statuses:
+            logging.error(f'Processing failed for at least one chunk of file: {file_name}. Skipping file.')
+            return "skip_file"
+        
+        # 4. Download all chunk results and merge them in page order
+        logging.info(f'Downloading {len(chunks)} chunks')
+        contents = []
+        for (chunk_name, _), (_, _, downloadlink) in zip(chunks, job_results):
+            content, result_file_name = self.fetch_processed_job_file(downloadlink, chunk_name)
+            if content is None:
+                return "skip_file"
+            contents.append(content)
+        
+        merged_content = self.merge_processed_job_files(contents)
+        if merged_content is None:
+            return "skip_file"
+        
+        job_ids = ",".join(str(job_id) for _, job_id, _ in job_results)
+        if output_sink:
+            saved = self.write_result_to_sink(merged_content, output_sink, str(file), self.calculate_file_hash(file), job_ids)
+        else:
+            saved = self.save_processed_job_file(merged_content, Path(file_name).stem + Path(result_file_name).suffix, output_folder)
+        
+        logging.debug(f'END - File {file_name} processed in {len(chunks)} chunks.')
+        return "completed" if saved else "skip_file"
+    
+    
+    # Merge processed chunk results in order, PDFs are merged page by page and text results are concatenated
+    def merge_processed_job_files(self, contents):
+        try:
+            if all(content.startswith(b"%PDF") for content in contents):
+                writer = PdfWriter()
+                for content in contents:
+                    writer.append(PdfReader(io.BytesIO(content)))
+                merged = io.BytesIO()
+                writer.write(merged)
+                return merged.getvalue()
+            
+            return b"\n".join(content.rstrip(b"\r\n") for content in contents) + b"\n"
+        except Exception as e:
+            logging.error(f'Failed to merge processed chunks. Message: {str(e)}')
+            return None
+
+
+    # Check if a file is a supported archive, returns "zip", "tar" or None
+    def get_archive_type(self, file):
+        file_name = Path(file).name.lower()
+        if not file_name.endswith(archive_extensions):
+            return None
+        if file_name.endswith(".zip"):
+            return "zip" if zipfile.is_zipfile(file) else None
+        return "tar" if tarfile.is_tarfile(file) else None
+    
+    
+    # Open an archive and list its file members as (member_name, member) tuples
+    def open_archive(self, archive_file, archive_type):
+        logging.debug(f'START - Opening archive: {archive_file}')
+        try:
+            if archive_type == "zip":
+                archive = zipfile.ZipFile(archive_file)
+                members = [(info.filename, info) for info in archive.infolist() if not info.is_dir()]
             else:
-                logging.error('File download-link not available. skipping file.')
+                archive = tarfile.open(archive_file, 'r:*')
+                members = [(member.name, member) for member in archive.getmembers() if member.isfile()]
+        except Exception as e:
+            logging.error(f'Failed to open archive "{Path(archive_file).name}". Error: {str(e)}. Skipping archive.')
+            return None, []
+        
+        # Skip metadata entries created by macOS archivers
+        members = [(name, member) for name, member in members if not name.startswith("__MACOSX/")]
+        logging.debug(f'END - Archive opened, {len(members)} member(s) found.')
+        return archive, members
+    
+    
+    # Open a single archive member as a readable file object, without extracting it to disk
+    def open_archive_member(self, archive, member):
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.open(member)
+        return archive.extractfile(member)
+    
+    
+    # Get the uncompressed size of an archive member from the archive index
+    def get_archive_member_size(self, member) -> int:
+        if isinstance(member, zipfile.ZipInfo):
+            return member.file_size
+        return member.size
+    
+    
+    # Load the names of the archive members that were already processed, the manifest holds one JSON encoded name per line
+    def load_archive_manifest(self, manifest_file) -> set:
+        processed_members = set()
+        if not os.path.exists(manifest_file):
+            return processed_members
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        processed_members.add(json.loads(line))
+                    except ValueError:
+                        # A line cut off by an interrupted run, the member is simply processed again
+                        continue
+        except Exception as e:
+            logging.warning(f'Failed to read archive manifest "{manifest_file}". Error: {str(e)}. Processing all members.')
+            return set()
+        return processed_members
+    
+    
+    # Record a processed archive member in the manifest
+    def mark_archive_member_processed(self, manifest_file, processed_members, member_name) -> None:
+        processed_members.add(member_name)
+        self.append_archive_manifest(manifest_file, member_name)
+    
+    
+    # Move the archive and remove its manifest once all members have been processed
+    def finish_archive(self, archive_file, archive_name, member_names, processed_members, manifest_file, processed_files_folder) -> None:
+        if all(member_name in processed_members for member_name in member_names):
+            self.move_file_with_timestamp(archive_file, archive_name, processed_files_folder)
+            if os.path.exists(manifest_file):
+                os.remove(manifest_file)
+        else:
+            logging.warning(f'Not all members of archive "{archive_name}" were processed. Archive will be resumed on the next run.')
+    
+    
+    # Append a processed archive member to the manifest, so each member costs one line instead of a rewrite of the whole manifest
+    def append_archive_manifest(self, manifest_file, member_name) -> None:
+        try:
+            with open(manifest_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(member_name, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logging.error(f'Failed to write archive manifest "{manifest_file}". Error: {str(e)}')
+    
+    
+    # Process archives, members are streamed to the API without extracting them to disk
+    def process_archives(self, archive_files_list, endpoints, processed_files_folder, output_folder, output_sink=None) -> None:
+        logging.debug(f'START - process_archives: {archive_files_list}') 
+        for archive_file in archive_files_list:
+            archive_name = Path(archive_file).name
+            archive_stem = re.sub(archive_extensions_pattern, '', archive_name, flags=re.IGNORECASE)
+            logging.info(f'Processing archive: "{archive_name}"')
+            
+            archive, members = self.open_archive(archive_file, self.get_archive_type(archive_file))
+            if archive is None:
                 continue
             
+            # The manifest keeps track of processed members, so an interrupted archive resumes where it stopped
+            manifest_file = Path(processed_files_folder) / f'{archive_name}.members.jsonl'
+            processed_members = self.load_archive_manifest(manifest_file)
             
-            if move_processed_file:    
-                self.move_file_with_timestamp(file, file_name, processed_files_folder)
+            skip_folder = False
+            with archive:
+                for member_name, member in members:
+                    if member_name in processed_members:
+                        logging.debug(f'Archive member already processed: "{member_name}"')
+                        continue
+                    
+                    file_name = Path(member_name).name
+                    logging.info(f'Processing archive member: "{member_name}"')
+                    
+                    try:
+                        with self.open_archive_member(archive, member) as member_file:
+                            # The hash is calculated while the member is streamed to the upload, so it is read only once
+                            hashing_file = Hashing_reader(member_file)
+                            job_result, job_id, downloadlink = self.run_pipeline(endpoints, hashing_file, file_name, self.get_archive_member_size(member))
+                            file_hash = hashing_file.hexdigest() if output_sink and job_result == "completed" else None
+                    except Exception as e:
+                        logging.error(f'Failed to read archive member "{member_name}". Error: {str(e)}. Skipping file.')
+                        continue
+                    
+                    if job_result == "skip_folder":
+                        skip_folder = True
+                        break
+                    if job_result == "skip_file":
+                        continue
+                    
+                    # 4. Download file, the output name is derived from the archive and member path
+                    logging.info(f'Downloading file')
+                    if not downloadlink:
+                        logging.error('File download-link not available. skipping file.')
+                        continue
+                    
+                    if output_sink:
+                        source = f'{archive_file}/{member_name}'
+                        if not self.write_processed_job_to_sink(downloadlink, output_sink, source, file_hash, job_id):
+                            continue
+                    else:
+                        output_file_name = f'{archive_stem}_{member_name.replace("/", "_")}'
+                        if not self.download_processed_job_files(downloadlink, output_folder, output_file_name, keep_original_name=True):
+                            continue
+                    
+                    self.run_when_durable(output_sink, functools.partial(self.mark_archive_member_processed, manifest_file, processed_members, member_name))
+                    
+                    # Add 1 to total processed files
+                    self.total_files += 1
             
-            # Add 1 to total processed files
-            self.total_files += 1
-        
-        logging.debug('END - All files processed from folder.')
+            if skip_folder:
+                break
             
+            # Move the archive only once all members have been processed and their records are durable
+            self.run_when_durable(output_sink, functools.partial(self.finish_archive, archive_file, archive_name, [member_name for member_name, _ in members], processed_members, manifest_file, processed_files_folder))
+        
+        logging.debug('END - All archives processed from folder.')
 
 
     def process_folder(self, folder_configs):
@@ -714,7 +1654,7 @@ class API_file_processor:
         
         folder_path = Path(folder_configs["folder_path"])
         output_folder = Path(folder_configs["output_folder"])
-        endpoint = folder_configs["endpoint"]
+        endpoints = folder_configs["pipeline"] or [folder_configs["endpoint"]]
         
         if not self.check_folder_path_exists(folder_path):
             return
@@ -728,10 +1668,31 @@ class API_file_processor:
         
         folder_files_list = self.list_files_in_folder(folder_path)
         
+        # Separate archives from regular files, archives are processed as virtual folders
+        archive_files_list = []
+        if folder_configs["process_archives"]:
+            archive_files_list = [file for file in folder_files_list if self.get_archive_type(file)]
+            folder_files_list = [file for file in folder_files_list if file not in archive_files_list]
+        
+        # Results are appended to rolling shards instead of one file per result
+        output_sink = None
+        if folder_configs["output_sink"]:
+            output_sink = Output_sink(output_folder, folder_configs["output_sink"])
+        
         # add 1 to total_folders
         self.total_folders += 1
         
-        self.process_files(folder_files_list, endpoint, processed_files_folder, output_folder)
+        try:
+            self.process_files(folder_files_list, endpoints, processed_files_folder, output_folder, output_sink, folder_configs["split"])
+            
+            if archive_files_list:
+                self.process_archives(archive_files_list, endpoints, processed_files_folder, output_folder, output_sink)
+        finally:
+            if output_sink:
+                try:
+                    output_sink.close()
+                except Exception as e:
+                    logging.error(f'Failed to close output sink shard. Message: {str(e)}. Files of the unclosed shard will be processed again on the next run.')
         
         logging.debug('END - process_folder')      
         
@@ -749,7 +1710,9 @@ if __name__ == "__main__":
         api_file_processor_config = read_api_file_processor_config_file(root_path)      
         
         # Initialize the API_file_processor class
-        afp = API_file_processor(api_file_processor_config, env_config["api_key"])        
+        job_history = Job_history(root_path / "api_job_history.jsonl")
+        api_key_pool = API_key_pool(env_config["api_keys"])
+        afp = API_file_processor(api_file_processor_config, api_key_pool, job_history)        
         afp.process_all_folders()
         
         end_time = time.time()